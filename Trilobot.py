@@ -29,15 +29,34 @@
   Date:       23-Jul-2022
 """
 
+import logging
+import os
+import queue
+import threading
 from time import perf_counter, sleep
-from random import random
+from types import SimpleNamespace
 import numpy as np
+from numba import njit
 import vl53l5cx_ctypes as vl53l5cx
+from gpiozero import DigitalInputDevice
 from trilobot import Trilobot, BUTTON_A, LIGHT_FRONT_LEFT, LIGHT_MIDDLE_LEFT, LIGHT_REAR_LEFT, LIGHT_FRONT_RIGHT, LIGHT_MIDDLE_RIGHT, LIGHT_REAR_RIGHT
 
 DEBUG = True
 DEBUG_1 = False
 
+# Debug output goes through logging so disabled messages are never formatted
+#   Only the trilobot logger follows DEBUG, so third party loggers (numba) stay quiet
+logging.basicConfig(format="%(message)s", level=logging.WARNING)
+log = logging.getLogger("trilobot")
+log.setLevel(logging.DEBUG if DEBUG else logging.INFO)
+
+# Cached once, so the per-tick debug checks are a single global load
+DEBUG_LOG = log.isEnabledFor(logging.DEBUG)
+
+# Only dump the distance arrays every DEBUG_DUMP_TICKS calls to np_average_distances()
+DEBUG_DUMP_TICKS = 20
+debug_tick_count = 0
+
 # Default values for the distance_reading() function
 COLLISION_THRESHOLD_MM  = 200
 MAX_NUM_READINGS        = 10
@@ -49,10 +68,13 @@ NORMAL_LEFT_SPEED       = 0.50
 NORMAL_LEFT_OFFSET      = 0.0
 NORMAL_RIGHT_SPEED      = 0.50
 NORMAL_RIGHT_OFFSET     = -0.50
+FORWARD_LEFT_SPEED      = NORMAL_LEFT_SPEED + NORMAL_LEFT_OFFSET
+FORWARD_RIGHT_SPEED     = NORMAL_RIGHT_SPEED + NORMAL_RIGHT_OFFSET
 
 # Turning parameters
 TURN_SPEED              = 0.45
 TURN_TIME_SEC           = 0.45
+TURN_READ_SEC           = 0.25    # Sleep the sensor read used to add to every turn
 TURN_RIGHT_PERCENT      = 45
 TURN_TOLERANCE_MM       = 1.0
 LEFT                    = 1
@@ -78,10 +100,10 @@ DEFAULT_BLINK_RATE_SEC  = 0.25
 DEFAULT_NUM_CYCLES      = 1
 
 # Light groups
-LEFT_LIGHTS             = [ LIGHT_FRONT_LEFT, LIGHT_MIDDLE_LEFT ]
-RIGHT_LIGHTS            = [ LIGHT_FRONT_RIGHT, LIGHT_MIDDLE_RIGHT ]
-REAR_LIGHTS             = [ LIGHT_REAR_LEFT, LIGHT_REAR_RIGHT ]
-FRONT_LIGHTS            = [ LIGHT_FRONT_LEFT, LIGHT_FRONT_RIGHT ]
+LEFT_LIGHTS             = ( LIGHT_FRONT_LEFT, LIGHT_MIDDLE_LEFT )
+RIGHT_LIGHTS            = ( LIGHT_FRONT_RIGHT, LIGHT_MIDDLE_RIGHT )
+REAR_LIGHTS             = ( LIGHT_REAR_LEFT, LIGHT_REAR_RIGHT )
+FRONT_LIGHTS            = ( LIGHT_FRONT_LEFT, LIGHT_FRONT_RIGHT )
 
 # VL53L5CX Sensor Constants
 RANGE_PERCENT = 0.50
@@ -90,7 +112,23 @@ DATA_THRESHOLD = 2000.0
 INTEGRATION_TIME_MS = 20
 SHARPENER_PERCENT = 40
 
-def blink_underlights(trilobot, group, color, nr_cycles=DEFAULT_NUM_CYCLES, blink_rate_sec=DEFAULT_BLINK_RATE_SEC):
+# BCM pin wired to the VL53L5CX INT line (active low), or None to poll the sensor
+VL53L5CX_INT_PIN = None
+VL53L5CX_WAIT_TIMEOUT_SEC = 0.1
+VL53L5CX_POLL_SEC = 0.005
+RANGING_FREQUENCY_HZ = 15
+
+# Control loop period, one tick per VL53L5CX frame
+CONTROL_PERIOD_SEC = 1.0 / RANGING_FREQUENCY_HZ
+
+# Number of uniform random numbers drawn at a time for uniform_random()
+RANDOM_POOL_SIZE = 1024
+
+# Real-time scheduling for the control loop, needs root or CAP_SYS_NICE
+CONTROL_PRIORITY = 80
+CONTROL_CPU = 3
+
+def blink_underlights(trilobot, group, color, nr_cycles=DEFAULT_NUM_CYCLES, blink_rate_sec=DEFAULT_BLINK_RATE_SEC, wait=sleep):
   '''
       Blink underlighting by group
 
@@ -102,222 +140,323 @@ def blink_underlights(trilobot, group, color, nr_cycles=DEFAULT_NUM_CYCLES, blin
       Optional inputs:
         int             nr_cycles               Number of cycles of blinking
         float           blink_rate_sec          The blink rate in seconds
+        function        wait                    Called as wait(seconds) for each on and off time,
+                                                  the blink stops early when it returns True
 
       Returns:
         None
   '''
+  set_underlights = trilobot.set_underlights
+  clear_underlights = trilobot.clear_underlights
+
   for cy in range(nr_cycles):
-    trilobot.set_underlights(group, color)
-    sleep(blink_rate_sec)
-    trilobot.clear_underlights(group)
+    set_underlights(group, color)
+    stop = wait(blink_rate_sec)
+    clear_underlights(group)
+
+    # Lights stay off for the blink rate between cycles
+    if stop or (cy < nr_cycles - 1 and wait(blink_rate_sec)):
+      break
+
+class LightDriver:
+  '''
+      Blink underlighting from a background thread, so the control loop
+        never sleeps on the lights
 
-  return None
+      Required inputs:
+        instance        trilobot                The current Trilobot instance
+  '''
+  def __init__(self, trilobot):
+    self._trilobot = trilobot
+    self._queue = queue.Queue()
+    self._lock = threading.Lock()
+    self._wake = threading.Condition(self._lock)
+    self._generation = 0
+    self._pending = 0
+    self._off_until = 0.0
+    self._thread = threading.Thread(target=self._run, daemon=True)
+    self._thread.start()
+
+  def request(self, group, color, nr_cycles=DEFAULT_NUM_CYCLES, blink_rate_sec=DEFAULT_BLINK_RATE_SEC, urgent=False):
+    '''
+        Queue a blink_underlights() request and return immediately
+
+        An urgent request drops any waiting requests and cuts short the
+          blink in progress, so it starts right away
+    '''
+    with self._lock:
+      if urgent:
+        while True:
+          try:
+            self._queue.get_nowait()
+          except queue.Empty:
+            break
+
+          self._pending -= 1
+
+        self._generation += 1
+        self._wake.notify_all()
+
+      self._pending += 1
+      self._queue.put((group, color, nr_cycles, blink_rate_sec, self._generation))
+
+  def idle(self):
+    '''
+        True when no blink is waiting or running, and the lights have been
+          off for the blink rate since the last one finished
+    '''
+    with self._lock:
+      return self._pending == 0 and perf_counter() >= self._off_until
+
+  def _interrupted(self, generation, wait_sec):
+    '''
+        Wait up to wait_sec, returning True early if an urgent request came in
+    '''
+    with self._wake:
+      return self._wake.wait_for(lambda: self._generation != generation, timeout=wait_sec)
+
+  def _run(self):
+    while True:
+      group, color, nr_cycles, blink_rate_sec, generation = self._queue.get()
+
+      try:
+        if generation == self._generation:
+          blink_underlights(self._trilobot, group, color, nr_cycles, blink_rate_sec,
+            wait=lambda wait_sec: self._interrupted(generation, wait_sec))
+      except Exception as error:
+        log.error("(LightDriver) Unable to blink the underlights: %s", error)
+      finally:
+        with self._lock:
+          self._pending -= 1
+          self._off_until = perf_counter() + blink_rate_sec
 
 def print_array(arr):
   '''
-    Print a floating point array formatted row/column format
+    Print an array in row/column format
     Currently, a two dimension array is assumed.
   '''
-  _rows = len(arr)
-
-  try:
-    _cols = len(arr[0])
-  except TypeError:
-    _rows = 1
-    _cols = len(arr)
+  arr = np.asarray(arr)
 
   if DEBUG_1:
-    print(f"(print_array) Rows: {_rows}, Cols: {_cols}")
-
-  print("[")
-
-  for r in range(_rows):
-    print("  [ ", end="")
-
-    for c in range(_cols):
-      if DEBUG_1:
-        print(F"(print_array) r = {r}, c = {c}") 
+    print(f"(print_array) Shape: {arr.shape}")
 
-      if isinstance(c, int):
-        print("{0:6d}".format(arr[r][c]), end="")
-      else:
-        print("{0:6.3f}".format(arr[r][c]), end="")
-
-      if c == _cols - 1:
-        print(" ]")
-      else:
-        print(", ", end="")
+  print(np.array2string(arr, max_line_width=120))
 
-  print("]")
+  if arr.ndim == 1:
+    return 1, arr.size
 
-  return _rows, _cols
+  return arr.shape
 
-def np_distances_vl53l5cx_mm(vl53l5cx):
+def np_distances_vl53l5cx_mm(vl53, out=None):
   '''
       Get an array of distance measurements in mm
 
       Required inputs:
-        instance        vl53l5cx            Instance of the VL53L5CX sensor
+        instance        vl53                Instance of the VL53L5CX sensor
+
+      Optional inputs:
+        numpy.ndarray   out                 8x8 uint16 array to fill in, instead of allocating one
 
       Returns:
         float           distances           numpy.ndarray of distances in mm
   '''
-  # Wait for valid data
-  while not vl53l5cx.data_ready():
-    pass
+  # Wait for valid data, sleeping on the INT line rather than spinning
+  while not vl53.data_ready():
+    if vl53_int is not None:
+      vl53_int.wait_for_active(timeout=VL53L5CX_WAIT_TIMEOUT_SEC)
+    else:
+      sleep(VL53L5CX_POLL_SEC)
 
-  #   Pick out the data to look at
+  if out is None:
+    out = np.empty((8, 8), dtype=np.uint16)
+
+  #   Pick out the data to look at, straight from the ctypes buffer when we can
   data = vl53.get_data()
-  distances_mm = np.array(data.distance_mm, dtype='uint64').reshape((8, 8))
 
-  #   Data must be flipped horizontilly and vertically to be useful
-  distances_mm = np.flipud(distances_mm).astype('uint64')
-  distances_mm = np.fliplr(distances_mm).astype('uint64')
+  try:
+    distances_mm = np.frombuffer(data.distance_mm, dtype=np.uint16, count=64)
+  except TypeError:
+    distances_mm = np.asarray(data.distance_mm, dtype=np.uint16)[:64]
 
-  sleep(0.25)
+  #   Data must be flipped horizontilly and vertically to be useful,
+  #     a single reversed view does both while copying into out
+  np.copyto(out, distances_mm.reshape((8, 8))[::-1, ::-1])
 
-  return distances_mm
+  return out
 
-def np_extract(arr, start_row, start_col, end_row, end_col):
+class FrameReader:
   '''
-      Extract data from a numpy.ndarray
-  '''
-  if not isinstance(arr, np.ndarray):
-    raise ValueError("First parameter must be a 1 or 2 dimension numpy.ndarray")
-
-  _nr_rows = len(arr)
+      Read VL53L5CX frames on a background thread, keeping only the newest,
+        so the control loop never waits for the sensor
 
-  try:
-    _nr_cols = len(arr[0])
-  except TypeError:
-    _nr_rows = 1
-    _nr_cols = len(arr)
-
-  _mm = []
-
-  if DEBUG_1:
-    print("(np_extract) Input data")
-    print_array(arr)
-    print("(np_extract)")
-    print(F"(np_extract) _nr_rows = {_nr_rows}, _nr_cols = {_nr_cols}")
-    print(F"(np_extract) start_row = {start_row}, start_col = {start_col}, end_row = {end_row}, end_col = {end_col}")
+      Frames are triple buffered in preallocated arrays. The frame returned by
+        latest() stays untouched until the next call to latest().
 
-  valid = start_row >= 0 and start_col >= 0 and start_row <= _nr_rows and start_col <= _nr_cols and end_row >= 0 and end_col >= 0 and end_row <= _nr_rows and end_col <= _nr_cols
+      If reading the sensor fails, the thread stops and latest() raises that
+        exception, so a dead sensor is never mistaken for a clear path.
 
-  if DEBUG_1:
-    print(F"(np_extract) Valid = {valid}")
+      Required inputs:
+        instance        vl53                    Instance of the VL53L5CX sensor
+  '''
+  def __init__(self, vl53):
+    self._vl53 = vl53
+    self._lock = threading.Lock()
+    self._ready = threading.Event()
+    self._buffers = [ np.empty((8, 8), dtype=np.uint16) for b in range(3) ]
+    self._write = 0
+    self._latest = 1
+    self._read = 2
+    self._fresh = False
+    self._error = None
+    self._thread = threading.Thread(target=self._run, daemon=True)
+    self._thread.start()
+
+  def latest(self):
+    '''
+        Return the newest distance frame, waiting only for the very first one
+    '''
+    self._ready.wait()
+
+    if self._error is not None:
+      raise self._error
+
+    with self._lock:
+      if self._fresh:
+        self._read, self._latest = self._latest, self._read
+        self._fresh = False
+
+      return self._buffers[self._read]
+
+  def _run(self):
+    try:
+      while True:
+        np_distances_vl53l5cx_mm(self._vl53, self._buffers[self._write])
+
+        with self._lock:
+          self._write, self._latest = self._latest, self._write
+          self._fresh = True
+
+        self._ready.set()
+    except Exception as error:
+      self._error = error
+      self._ready.set()
+
+@njit(cache=True, fastmath=True)
+def reduce_rois(frame):
+  '''
+      Compiled reduction of a distance frame to left, right, and center
+        averages plus the collision test, in one call
 
-  if valid:
-    if DEBUG_1:
-      print("(np_extract) Validated data")
+      Required inputs:
+        numpy.ndarray   frame                   8x8 uint16 distances in mm
 
-    for r in range(start_row, end_row + 1, 1):
-      if DEBUG_1:
-        print(F"(np_extract) r = {r}")
+      Returns:
+        int             left_distance_mm        Average of the two left columns
+        int             right_distance_mm       Average of the two right columns
+        int             center_distance_mm      Average of the center 4x4
+        bool            collision               True when center is within COLLISION_THRESHOLD_MM
+  '''
+  center_distance_mm = int(frame[2:6, 2:6].mean())
+  left_distance_mm = int(frame[:, 0:2].mean())
+  right_distance_mm = int(frame[:, 6:8].mean())
 
-      _row = []
+  return left_distance_mm, right_distance_mm, center_distance_mm, center_distance_mm <= COLLISION_THRESHOLD_MM
 
-      for c in range(start_col, end_col + 1, 1):
-        if DEBUG_1:
-          print(F"(np_extract) c = {c}")
-        _row.append(arr[r][c])
+def np_average_distances(frames):
+  '''
+      Get distances for left, right, and center, and check to see if the
+        robot is about to collide with an obstacle
 
-      _mm.append(_row)
+      Required inputs:
+        instance        frames                  FrameReader for the VL53L5CX sensor
+  '''
 
-    if DEBUG_1:
-      print("(np_extract) Extracted data")
-      print_array(_mm)
-  else:
-    raise ValueError("(np_extract) Array boundaries are out of range!")
+  global debug_tick_count
 
-  return _mm
+  # Get the newest distance data from the VL53L5CX sensor
+  dist_mm = frames.latest()
 
-def np_average_distances(vl53):
-  '''
-      Get distances for left, right, and center
-  '''
+  left_distance_mm, right_distance_mm, center_distance_mm, collision = reduce_rois(dist_mm)
 
-  # Get distance data from the VL53L5CX sensor
-  dist_mm = np_distances_vl53l5cx_mm(vl53)
+  if DEBUG_LOG:
+    log.debug("(average_distances) Left distance = %d mm, Center distance = %d, Right distance = %d", left_distance_mm, center_distance_mm, right_distance_mm)
 
-  if DEBUG:
+  if DEBUG_LOG and debug_tick_count % DEBUG_DUMP_TICKS == 0:
     print("(np_average_distances) Distances")
     print_array(dist_mm)
     print()
-
-  if DEBUG:
     print("(np_average_distances) Center distance data")
-
-  _mm = np_extract(dist_mm, 2, 2, 5, 5)
-
-  center_distance_mm = int(np.average(_mm))
-
-  if DEBUG:
-    print_array(_mm)
+    print_array(dist_mm[2:6, 2:6])
     print()
     print("(np_average_distances) Left distance data")
-
-  _mm = np_extract(dist_mm, 0, 0, 7, 1)
-
-  left_distance_mm = int(np.average(_mm))
-
-  if DEBUG:
-    print_array(_mm)
+    print_array(dist_mm[:, 0:2])
     print()
     print("(np_average_distances) Right distance data")
+    print_array(dist_mm[:, 6:8])
+
+  debug_tick_count += 1
 
-  _mm = np_extract(dist_mm, 0, 6, 7, 7)
+  return left_distance_mm, right_distance_mm, center_distance_mm, collision
 
-  right_distance_mm = int(np.average(_mm))
+def drive(left_speed, right_speed):
+  '''
+      Set the motor speeds, skipping the motor driver when they have not changed
 
-  if DEBUG:
-    print_array(_mm)
+      Required inputs:
+        float           left_speed              Left motor speed
+        float           right_speed             Right motor speed
 
-  if DEBUG:
-    print(F"(average_distances) Left distance = {left_distance_mm} mm, Center distance = {center_distance_mm}, Right distance = {right_distance_mm}")
+      Returns:
+        None
+  '''
+  global current_speeds
 
-  return left_distance_mm, right_distance_mm, center_distance_mm
+  if current_speeds != (left_speed, right_speed):
+    set_motor_speeds(left_speed, right_speed)
+    current_speeds = (left_speed, right_speed)
 
-def check_for_collision(fwd_mm, threshold=COLLISION_THRESHOLD_MM):
+def uniform_random():
   '''
-      Check to see if the robot is about to collide with an obstacle
+      Get the next uniform random number in [0.0, 1.0) from the pool,
+        refilling the pool in bulk when it is used up
   '''
-  result = False
+  global random_pool, random_index
 
-  if fwd_mm <= threshold:
-    result = True
+  if random_index >= RANDOM_POOL_SIZE:
+    random_pool = rng.random(RANDOM_POOL_SIZE)
+    random_index = 0
 
-  return result
+  value = random_pool[random_index]
+  random_index += 1
+
+  return value
 
 def turn_left():
-  if DEBUG:
-    print("(main) Turning left")
+  log.debug("(main) Turning left")
 
-  last_turn = LEFT
-  blink_underlights(trilobot, LEFT_LIGHTS, BLUE)
+  state.last_turn = LEFT
+  lights.request(LEFT_LIGHTS, BLUE, urgent=True)
 
-  if DRIVE_ON:
-    trilobot.set_motor_speeds(-TURN_SPEED, TURN_SPEED)
+  drive(-TURN_SPEED, TURN_SPEED)
 
 def turn_right():
-  if DEBUG:
-    print("(main) Turning right")
+  log.debug("(main) Turning right")
 
-  last_turn = RIGHT
-  blink_underlights(trilobot, RIGHT_LIGHTS, BLUE)
+  state.last_turn = RIGHT
+  lights.request(RIGHT_LIGHTS, BLUE, urgent=True)
 
-  if DRIVE_ON:
-    trilobot.set_motor_speeds(TURN_SPEED, -TURN_SPEED)
+  drive(TURN_SPEED, -TURN_SPEED)
 
 def backup(loops=DEFAULT_BACKUP_LOOPS, wait_sec=DEFAULT_BACKUP_TIME_SEC):
-  if DEBUG:
-    print("(main) Backing up")
+  log.debug("(main) Backing up")
+
+  # Each step also used to include the blocking rear blink, keep that reverse time
+  step_sec = wait_sec + DEFAULT_BLINK_RATE_SEC
 
-  if DRIVE_ON:
-    for l in range(loops):
-      blink_underlights(trilobot, REAR_LIGHTS, YELLOW)
-      trilobot.set_motor_speeds(-TURN_SPEED, -TURN_SPEED)
-      sleep(wait_sec)
+  for l in range(loops):
+    lights.request(REAR_LIGHTS, YELLOW, urgent=True)
+    drive(-TURN_SPEED, -TURN_SPEED)
+    sleep(step_sec)
 
 '''
   *****************************************************************************
@@ -331,9 +470,18 @@ print("    Beginning Initialization")
 print()
 
 trilobot = Trilobot()
+current_speeds = None
+lights = LightDriver(trilobot)
 
 collision = False
 
+# Mutable robot state shared by the main line and the turn functions
+state = SimpleNamespace(last_turn=0)
+
+rng = np.random.default_rng()
+random_pool = rng.random(RANDOM_POOL_SIZE)
+random_index = 0
+
 print("    Initializing the VL53L5CX ToF distance sensor, please stand by... ", end="")
 
 vl53 = vl53l5cx.VL53L5CX()
@@ -345,73 +493,106 @@ vl53.set_resolution(8 * 8)
 vl53.set_target_order(0)
 
 #   This is a visual demo, so prefer speed over accuracy
-vl53.set_ranging_frequency_hz(15)
+vl53.set_ranging_frequency_hz(RANGING_FREQUENCY_HZ)
 vl53.set_integration_time_ms(INTEGRATION_TIME_MS)
 vl53.set_sharpener_percent(SHARPENER_PERCENT)
 
+#   Use the INT line, when wired, to wait for data ready
+if VL53L5CX_INT_PIN is not None:
+  vl53_int = DigitalInputDevice(VL53L5CX_INT_PIN, pull_up=True)
+else:
+  vl53_int = None
+
 print("Done!")
 
 vl53.start_ranging()
+frames = FrameReader(vl53)
 
 # Turn drive on or off
 DRIVE_ON = False
 
+#   Decided once here, so drive() never has to test DRIVE_ON
+if DRIVE_ON:
+  set_motor_speeds = trilobot.set_motor_speeds
+else:
+  set_motor_speeds = lambda left_speed, right_speed: None
+
 '''
   *****************************************************************************
   Start of Main Line
   *****************************************************************************
 '''
 
-if DEBUG:
-  print()
+#   Compile reduce_rois() now, rather than at real-time priority on the pinned CPU
+reduce_rois(np.zeros((8, 8), dtype=np.uint16))
+
+#   Run the control loop under SCHED_FIFO, pinned to its own CPU, so other
+#     processes can not preempt it. A PREEMPT_RT kernel tightens this further.
+try:
+  os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(CONTROL_PRIORITY))
+except PermissionError:
+  log.warning("(main) SCHED_FIFO needs root or CAP_SYS_NICE, using the default scheduler")
+
+try:
+  os.sched_setaffinity(0, {CONTROL_CPU})
+except OSError:
+  log.warning("(main) Unable to pin the control loop to CPU %d", CONTROL_CPU)
+
+log.debug("")
 
 try:
-  left_distance_mm, right_distance_mm, center_distance_mm = np_average_distances(vl53)
-  collision = check_for_collision(center_distance_mm)
+  left_distance_mm, right_distance_mm, center_distance_mm, collision = np_average_distances(frames)
 
   percent = 0.0
-  last_turn = 0
 
   while True:
-    if DEBUG:
-      print(F"(main) Moving forward: Left distance = {left_distance_mm} mm, Center distance = {center_distance_mm}, Right distance = {right_distance_mm}")
+    log.debug("(main) Moving forward: Left distance = %d mm, Center distance = %d, Right distance = %d", left_distance_mm, center_distance_mm, right_distance_mm)
 
-    if DRIVE_ON:
-      trilobot.set_motor_speeds(NORMAL_LEFT_SPEED + NORMAL_LEFT_OFFSET, NORMAL_RIGHT_SPEED + NORMAL_RIGHT_OFFSET)
+    drive(FORWARD_LEFT_SPEED, FORWARD_RIGHT_SPEED)
 
     # Move forward until we have a collision nevent
+    next_tick = perf_counter() + CONTROL_PERIOD_SEC
+    overrun = False
+
     while not collision:
-      if DEBUG:
-        print("(main) Center distance is {0:5.2f} mm, Collision is {1}".format(center_distance_mm, collision))
+      if DEBUG_LOG:
+        log.debug("(main) Center distance is %5.2f mm, Collision is %s", center_distance_mm, collision)
+
+      # Lights are skipped on the tick after an overrun so we can catch up,
+      #   and only requested once the last blink has been picked up
+      if not overrun and lights.idle():
+        lights.request(FRONT_LIGHTS, GREEN)
+
+      left_distance_mm, right_distance_mm, center_distance_mm, collision = np_average_distances(frames)
+
+      # Sleep until the next deadline, so the period does not depend on how long the work took
+      delay = next_tick - perf_counter()
+      overrun = delay <= 0.0
 
-      blink_underlights(trilobot, FRONT_LIGHTS, GREEN)
-      left_distance_mm, right_distance_mm, center_distance_mm = np_average_distances(vl53)
-      collision = check_for_collision(center_distance_mm)
-      sleep(0.25)
+      if overrun:
+        log.debug("(main) Control loop overran by %.3f sec", -delay)
+        next_tick = perf_counter() + CONTROL_PERIOD_SEC
+      else:
+        sleep(delay)
+        next_tick += CONTROL_PERIOD_SEC
 
     # React to a possible collision
     while collision:
-      percent = random() * 100.0
-
-      if DEBUG:
-        print("(main) Reacting to an imminent collision")
-        print("(main)")
+      log.debug("(main) Reacting to an imminent collision")
 
       backup()
 
-      if DEBUG:
-        print("(main) Beginning turn distance = {0:5.2f}, Collision = {1}".format(center_distance_mm, collision))
+      log.debug("(main) Beginning turn distance = %5.2f, Collision = %s", center_distance_mm, collision)
 
-      percent = round(random() * 100.0, 2)
+      percent = round(uniform_random() * 100.0, 2)
 
-      if DEBUG:
-        print(F"(main) Choosing Turn Direction: Percent = {percent}, Left = {left_distance_mm} mm, Right = {right_distance_mm} mm")
+      log.debug("(main) Choosing Turn Direction: Percent = %s, Left = %d mm, Right = %d mm", percent, left_distance_mm, right_distance_mm)
 
-      #if (percent < 50.0 and last_turn == RIGHT) or right_distance_mm >= left_distance_mm + TURN_TOLERANCE_MM:
+      #if (percent < 50.0 and state.last_turn == RIGHT) or right_distance_mm >= left_distance_mm + TURN_TOLERANCE_MM:
       if right_distance_mm >= left_distance_mm + TURN_TOLERANCE_MM:
         # Turn right
         turn_right()
-      #elif (percent > 50.0 and last_turn == LEFT) or left_distance_mm >= right_distance_mm + TURN_TOLERANCE_MM:
+      #elif (percent > 50.0 and state.last_turn == LEFT) or left_distance_mm >= right_distance_mm + TURN_TOLERANCE_MM:
       elif left_distance_mm >= right_distance_mm + TURN_TOLERANCE_MM:
         # Turn left
         turn_left()
@@ -419,22 +600,23 @@ try:
         turn_right()
       elif percent >= 50.0:
         turn_left()
-      else;
+      else:
         backup()
 
-      sleep(TURN_TIME_SEC)
+      # Keep the turn angle the same as when the sensor read slept after the turn
+      sleep(TURN_TIME_SEC + TURN_READ_SEC)
 
-      left_distance_mm, right_distance_mm, center_distance_mm = np_average_distances(vl53)
-      collision = check_for_collision(center_distance_mm)
+      left_distance_mm, right_distance_mm, center_distance_mm, collision = np_average_distances(frames)
 
-      if DEBUG:
-        print("(main) Turning distance = {0:5.2f} mm, Collision = {1}".format(center_distance_mm, collision))
+      log.debug("(main) Turning distance = %5.2f mm, Collision = %s", center_distance_mm, collision)
 
-    if DEBUG:
-      print("Exit turn distance is {0:5.2f} mm, Collision is {1}".format(center_distance_mm, collision))
+    log.debug("Exit turn distance is %5.2f mm, Collision is %s", center_distance_mm, collision)
 except KeyboardInterrupt:
   trilobot.set_motor_speeds(0.0, 0.0)
 
-  if DEBUG:
-    print()
-    print("Exiting by Ctrl/C")
+  log.debug("")
+  log.debug("Exiting by Ctrl/C")
+except Exception:
+  #   Stop before exiting, so systemd restarts a stationary robot
+  trilobot.set_motor_speeds(0.0, 0.0)
+  raise
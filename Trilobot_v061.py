@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 
-from time import perf_counter, sleep
+from time import sleep
 from random import randint
 from trilobot import Trilobot, BUTTON_A, LIGHT_FRONT_LEFT, LIGHT_MIDDLE_LEFT, LIGHT_REAR_LEFT, LIGHT_FRONT_RIGHT, LIGHT_MIDDLE_RIGHT, LIGHT_REAR_RIGHT
 
@@ -110,23 +110,20 @@ def distance_reading_cm(trilobot, collision_threshold_cm=COLLISION_THRESHOLD_CM,
   # Take 10 measurements rapidly
   readings_count = 0
   distance_total_cm = 0.0
-  distance_total_cm
   collision = False
+  read_distance = trilobot.read_distance
 
   for num in range(nr_readings):
-    clock_check = perf_counter()
-    counter = 0
-    distance = -1.0
-
-    while distance < 0.0 and counter < 10:
-      # Make sure the reading is valid
-      distance = trilobot.read_distance(timeout=timeout_sec, samples=nr_samples)
-      counter += 1
-
-      if counter >= 10:
-        emsg = "Unable to get a valid distance reading!"
-        blink_underlighting(trilobot, [LEFT_LIGHTS, RIGHT_LIGHTS], RED, 10)
-        raise ValueError(emsg)
+    # Make sure the reading is valid, retrying up to 10 times
+    for retry in range(10):
+      distance = read_distance(timeout=timeout_sec, samples=nr_samples)
+
+      if distance >= 0.0:
+        break
+    else:
+      emsg = "Unable to get a valid distance reading!"
+      blink_underlights(trilobot, LEFT_LIGHTS + RIGHT_LIGHTS, RED, 10)
+      raise ValueError(emsg)
 
     readings_count += 1
     distance_total_cm += distance
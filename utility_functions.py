@@ -15,12 +15,13 @@ def blink_underlights(trilobot, group, color, nr_cycles=DEFAULT_NUM_CYCLES, blin
       Returns:
         None
   '''
+  set_underlights = trilobot.set_underlights
+  clear_underlights = trilobot.clear_underlights
+
   for cy in range(nr_cycles):
-    trilobot.set_underlights(group, color)
+    set_underlights(group, color)
     sleep(blink_rate_sec)
-    trilobot.clear_underlights(group)
-
-  return None
+    clear_underlights(group)
 
 def translate(value, to_min, to_max, from_min, from_max):
   '''
@@ -39,37 +40,17 @@ def translate(value, to_min, to_max, from_min, from_max):
 
 def print_array(arr):
   '''
-    Print a floating point array formatted row/column format
+    Print an array in row/column format
     Currently, a two dimension array is assumed.
   '''
-  _rows = len(arr)
-
-  try:
-    _cols = len(arr[0])
-  except TypeError:
-    _rows = 1
-    _cols = len(arr)
-
-  #print(f"Rows: {rows}, Cols: {cols}")
-  print("[")
-
-  for r in range(_rows):
-    print("  [ ", end="")
-
-    for c in range(_cols):
-      if isinstance(c, int):
-        print("{0:6d}".format(arr[r][c]), end="")
-      else:
-        print("{0:6.3f}".format(arr[r][c]), end="")
+  arr = np.asarray(arr)
 
-      if c == cols - 1:
-        print(" ]")
-      else:
-        print(", ", end="")
+  print(np.array2string(arr, max_line_width=120))
 
-  print("]")
+  if arr.ndim == 1:
+    return 1, arr.size
 
-  return rows, cols
+  return arr.shape
 
 def distance_ultrasonic_reading_cm(trilobot, collision_threshold_cm=COLLISION_THRESHOLD_MM, nr_readings=MAX_NUM_READINGS, nr_samples=MAX_NUM_SAMPLES, timeout_sec=MAX_TIMEOUT_SEC):
   '''
@@ -93,23 +74,20 @@ def distance_ultrasonic_reading_cm(trilobot, collision_threshold_cm=COLLISION_TH
   # Take 10 measurements rapidly
   readings_count = 0
   distance_total_cm = 0.0
-  distance_total_cm
   collision = False
+  read_distance = trilobot.read_distance
 
   for num in range(nr_readings):
-    clock_check = perf_counter()
-    counter = 0
-    distance = -1.0
-
-    while distance < 0.0 and counter < 10:
-      # Make sure the reading is valid
-      distance = trilobot.read_distance(timeout=timeout_sec, samples=nr_samples)
-      counter += 1
-
-      if counter >= 10:
-        emsg = "Unable to get a valid distance reading!"
-        blink_underlighting(trilobot, [LEFT_LIGHTS, RIGHT_LIGHTS], RED, 10)
-        raise ValueError(emsg)
+    # Make sure the reading is valid, retrying up to 10 times
+    for retry in range(10):
+      distance = read_distance(timeout=timeout_sec, samples=nr_samples)
+
+      if distance >= 0.0:
+        break
+    else:
+      emsg = "Unable to get a valid distance reading!"
+      blink_underlights(trilobot, LEFT_LIGHTS + RIGHT_LIGHTS, RED, 10)
+      raise ValueError(emsg)
 
     readings_count += 1
     distance_total_cm += distance